@@ -1,21 +1,118 @@
 # admin.py - исправленный с полем описания
+from functools import partial
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
 from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.urls import reverse
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from django.contrib import messages
 from django.utils import timezone
+from .metrics import ADMIN_ACTIONS, STOCK_RESERVATIONS
 from .models import Product, Order
 
+
+class AutocompletePrefixSearchMixin:
+    """
+    Автодополнение ищет по префиксу индексированного поля и сортирует по нему же,
+    чтобы запрос шёл по индексу и стоил одинаково при любом размере таблицы.
+    Обычный поиск в списке объектов не меняется.
+    """
+    autocomplete_prefix_field = None
+
+    def is_autocomplete_request(self, request):
+        match = request.resolver_match
+        return match is not None and match.url_name == 'autocomplete'
+
+    def get_ordering(self, request):
+        if self.autocomplete_prefix_field and self.is_autocomplete_request(request):
+            return (self.autocomplete_prefix_field, 'pk')
+        return super().get_ordering(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        if self.autocomplete_prefix_field and self.is_autocomplete_request(request):
+            search_term = search_term.strip()
+            if search_term:
+                queryset = queryset.filter(**{f'{self.autocomplete_prefix_field}__istartswith': search_term})
+            return queryset, False
+        return super().get_search_results(request, queryset, search_term)
+
+
+class AutocompleteRelatedFilter(admin.RelatedFieldListFilter):
+    """
+    Фильтр по связанной модели без списка всех объектов: в боковой панели
+    select2-поле, варианты подгружаются через admin autocomplete по мере ввода.
+    Из БД выбирается только текущий выбранный объект.
+    """
+    template = 'admin/Main/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.request = request
+        self.admin_site = model_admin.admin_site
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def selected_pks(self):
+        values = self.lookup_val or []
+        if isinstance(values, str):
+            values = [values]
+        return [value for value in values if value.isdigit()]
+
+    def field_choices(self, field, request, model_admin):
+        selected = self.selected_pks()
+        if not selected:
+            return []
+        return field.get_choices(include_blank=False, limit_choices_to={'pk__in': selected})
+
+    def has_output(self):
+        return True
+
+    def hidden_params(self):
+        """Остальные параметры списка, чтобы форма фильтра их не потеряла"""
+        skip = {self.lookup_kwarg, self.lookup_kwarg_isnull, 'p'}
+        return [
+            (name, value)
+            for name, values in self.request.GET.lists() if name not in skip
+            for value in values
+        ]
+
+    def widget_html(self):
+        selected = self.selected_pks()
+        remote_model = self.field.remote_field.model
+        form_field = forms.ModelChoiceField(
+            queryset=remote_model._default_manager.filter(pk__in=selected),
+            required=False,
+            widget=AutocompleteSelect(self.field, self.admin_site),
+        )
+        return mark_safe(form_field.widget.render(
+            self.lookup_kwarg,
+            selected[0] if selected else None,
+            attrs={'id': f'filter_{self.lookup_kwarg}', 'onchange': 'this.form.submit()', 'style': 'width: 100%'},
+        ))
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class CustomerAdmin(AutocompletePrefixSearchMixin, UserAdmin):
+    # username уникален, значит проиндексирован
+    autocomplete_prefix_field = 'username'
+
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(AutocompletePrefixSearchMixin, admin.ModelAdmin):
     list_display = ('id', 'image_preview', 'name', 'category_display', 'price', 'quantity', 'is_active', 'updated_at_display')
     list_display_links = ('id', 'name')
     list_editable = ('price', 'quantity', 'is_active')
     search_fields = ('name', 'category', 'description')
     list_filter = ('category', 'is_active')
     readonly_fields = ('image_preview_large', 'updated_at_display_field')
+    autocomplete_prefix_field = 'name'
     
     # Сворачиваемое поле для описания
     fieldsets = (
@@ -63,10 +160,21 @@ class ProductAdmin(admin.ModelAdmin):
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user_info', 'product_info', 'quantity', 'total_price_display', 'status_display', 'created_at_display')
     list_display_links = ('id',)
-    list_filter = ('status', 'created_at', 'product')
+    list_filter = ('status', 'created_at', ('product', AutocompleteRelatedFilter))
     search_fields = ('id', 'user__username', 'product__name', 'product__description')
+    # Товар и покупатель выбираются через автодополнение, а не <select> со всеми записями
+    autocomplete_fields = ('product', 'user')
+    list_select_related = ('user', 'product')
+    # Не считаем COUNT(*) по всей таблице заказов на каждой странице списка
+    show_full_result_count = False
     readonly_fields = ('product_link', 'user', 'quantity', 'total_price', 'status_display_field', 'created_at_display_field')
     
+    @property
+    def media(self):
+        # Скрипты select2 нужны и в списке заказов - для фильтра по товару
+        product_field = Order._meta.get_field('product')
+        return super().media + AutocompleteSelect(product_field, self.admin_site).media
+    
     # Разрешаем создание и просмотр, но запрещаем редактирование статуса вручную
     def has_add_permission(self, request):
         return True
@@ -111,6 +219,7 @@ class OrderAdmin(admin.ModelAdmin):
             with transaction.atomic():
                 if not change:  # Новый заказ
                     if obj.quantity > obj.product.quantity:
+                        STOCK_RESERVATIONS.inc(source='admin_add', result='insufficient')
                         raise ValidationError(
                             f"❌ Недостаточно товара '{obj.product.name}' на складе. "
                             f"Доступно: {obj.product.quantity}, требуется: {obj.quantity}"
@@ -118,6 +227,7 @@ class OrderAdmin(admin.ModelAdmin):
                     
                     obj.product.quantity -= obj.quantity
                     obj.product.save()
+                    transaction.on_commit(partial(STOCK_RESERVATIONS.inc, source='admin_add', result='ok'))
                     obj.total_price = obj.product.price * obj.quantity
                     obj.status = 'NEW'
                     
@@ -288,6 +398,9 @@ class OrderAdmin(admin.ModelAdmin):
                 errors.append(f"Заказ №{order.id}: ошибка - {str(e)}")
                 failed += 1
         
+        ADMIN_ACTIONS.inc(success, action='mark_as_paid_action', result='ok')
+        ADMIN_ACTIONS.inc(failed, action='mark_as_paid_action', result='failed')
+        
         if success:
             self.message_user(request, f"✅ Оплачено заказов: {success}")
         if failed:
@@ -316,6 +429,9 @@ class OrderAdmin(admin.ModelAdmin):
                 errors.append(f"Заказ №{order.id}: ошибка - {str(e)}")
                 failed += 1
         
+        ADMIN_ACTIONS.inc(success, action='mark_as_shipped_action', result='ok')
+        ADMIN_ACTIONS.inc(failed, action='mark_as_shipped_action', result='failed')
+        
         if success:
             self.message_user(request, f"✅ Отправлено заказов: {success}")
         if failed:
@@ -344,6 +460,9 @@ class OrderAdmin(admin.ModelAdmin):
                 errors.append(f"Заказ №{order.id}: ошибка - {str(e)}")
                 failed += 1
         
+        ADMIN_ACTIONS.inc(success, action='mark_as_delivered_action', result='ok')
+        ADMIN_ACTIONS.inc(failed, action='mark_as_delivered_action', result='failed')
+        
         if success:
             self.message_user(request, f"✅ Доставлено заказов: {success}")
         if failed:
@@ -374,6 +493,9 @@ class OrderAdmin(admin.ModelAdmin):
                 errors.append(f"Заказ №{order.id}: ошибка - {str(e)}")
                 failed += 1
         
+        ADMIN_ACTIONS.inc(success, action='cancel_order_action', result='ok')
+        ADMIN_ACTIONS.inc(failed, action='cancel_order_action', result='failed')
+        
         if success:
             self.message_user(
                 request, 
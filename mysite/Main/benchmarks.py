@@ -0,0 +1,369 @@
+"""
+Воспроизводимые бенчмарки магазина.
+
+Данные создаются командой seed_benchmark_data (детерминированно, по seed),
+замеры запускает команда benchmark. Все сценарии, которые меняют данные,
+выполняются в транзакции с откатом, поэтому прогон можно повторять на той
+же базе. Работает офлайн на SQLite (DJANGO_DB_ENGINE=sqlite) или локальном MySQL.
+"""
+
+import math
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import CategoryFacet, Order, Product
+
+
+# Масштабы тестовых данных: товары, покупатели, заказы
+SCALES = {
+    'small': {'products': 1_000, 'users': 200, 'orders': 10_000},
+    'medium': {'products': 10_000, 'users': 2_000, 'orders': 100_000},
+    'large': {'products': 100_000, 'users': 20_000, 'orders': 1_000_000},
+}
+
+BENCH_PREFIX = 'bench'
+BENCH_ADMIN = f'{BENCH_PREFIX}_admin'
+BATCH_SIZE = 5_000
+
+# Доли статусов в сгенерированных заказах
+STATUS_WEIGHTS = {
+    'NEW': 30,
+    'PAID': 20,
+    'SHIPPED': 15,
+    'DELIVERED': 25,
+    'CANCELED': 10,
+}
+
+
+class RollbackBenchmark(Exception):
+    """Откат транзакции после замера"""
+
+
+# ------------------------------------------------------------------
+# Генерация данных
+# ------------------------------------------------------------------
+
+def flush_benchmark_data():
+    """Удалить все данные, созданные seed()"""
+    Order.objects.filter(product__name__startswith=f'{BENCH_PREFIX}-').delete()
+    Product.objects.filter(name__startswith=f'{BENCH_PREFIX}-').delete()
+    # Только пользователи, созданные seed(): bench_admin и bench_user_*
+    User.objects.filter(
+        Q(username=BENCH_ADMIN) | Q(username__startswith=f'{BENCH_PREFIX}_user_')
+    ).delete()
+
+
+def seed(products, users, orders, seed=42, stdout=None):
+    """Создать товары, покупателей и заказы для бенчмарков"""
+    rng = random.Random(seed)
+    categories = [code for code, _ in Product.CATEGORY_CHOICES]
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    flush_benchmark_data()
+    # Без пароля: бенчмарки входят через force_login, войти под bench_admin нельзя
+    User.objects.create_superuser(BENCH_ADMIN, f'{BENCH_ADMIN}@example.com', None)
+
+    Product.objects.bulk_create(
+        (
+            Product(
+                name=f'{BENCH_PREFIX}-{i:07d}',
+                category=rng.choice(categories),
+                description=f'Тестовый букет №{i}',
+                price=Decimal(rng.randrange(500, 15_000)),
+                quantity=rng.randrange(0, 500),
+                is_active=rng.random() > 0.1,
+            )
+            for i in range(products)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    CategoryFacet.rebuild()
+    log(f'Товаров: {products}')
+
+    User.objects.bulk_create(
+        (
+            User(username=f'{BENCH_PREFIX}_user_{i:07d}', password='!')
+            for i in range(users)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    log(f'Покупателей: {users}')
+
+    product_rows = list(
+        Product.objects.filter(name__startswith=f'{BENCH_PREFIX}-').values_list('id', 'price')
+    )
+    user_ids = list(
+        User.objects.filter(username__startswith=f'{BENCH_PREFIX}_user_').values_list('id', flat=True)
+    )
+
+    created = 0
+    while created < orders:
+        batch = []
+        for _ in range(min(BATCH_SIZE, orders - created)):
+            product_id, price = rng.choice(product_rows)
+            quantity = rng.randrange(1, 5)
+            batch.append(Order(
+                user_id=rng.choice(user_ids),
+                product_id=product_id,
+                quantity=quantity,
+                status=rng.choices(statuses, weights)[0],
+                total_price=price * quantity,
+            ))
+        # bulk_create не вызывает Order.save(), total_price посчитан выше
+        Order.objects.bulk_create(batch)
+        created += len(batch)
+        log(f'Заказов: {created}/{orders}')
+
+
+# ------------------------------------------------------------------
+# Статистика
+# ------------------------------------------------------------------
+
+def percentile(values, pct):
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, queries, wall_time, errors=0):
+    """Свести замеры сценария в словарь для JSON-отчёта"""
+    return {
+        'iterations': len(latencies),
+        'errors': errors,
+        'throughput_per_s': round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries': percentile(queries, 50) if queries else 0,
+    }
+
+
+def measure(func, iterations):
+    """Вызвать func iterations раз, записывая время и количество запросов"""
+    latencies = []
+    queries = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        # queries_log ограничен 9000 записей, иначе счётчик обнуляется на долгих прогонах
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(ctx.captured_queries))
+    return summarize(latencies, queries, time.perf_counter() - wall_start)
+
+
+def rolled_back(func):
+    """Выполнить func внутри транзакции и откатить её"""
+    def wrapper():
+        try:
+            with transaction.atomic():
+                func()
+                raise RollbackBenchmark
+        except RollbackBenchmark:
+            pass
+    return wrapper
+
+
+# ------------------------------------------------------------------
+# Сценарии
+# ------------------------------------------------------------------
+
+def _client():
+    host = settings.ALLOWED_HOSTS[0].lstrip('.') if settings.ALLOWED_HOSTS else 'localhost'
+    client = Client(HTTP_HOST=host)
+    admin_user = User.objects.get(username=BENCH_ADMIN)
+    client.force_login(admin_user)
+    return client
+
+
+def _get(client, url):
+    def run():
+        response = client.get(url)
+        assert response.status_code == 200, f'{url}: {response.status_code}'
+    return run
+
+
+def _bulk_action(client, action, status, batch):
+    ids = list(
+        Order.objects.filter(status=status, product__name__startswith=f'{BENCH_PREFIX}-')
+        .values_list('id', flat=True)[:batch]
+    )
+    url = reverse('admin:Main_order_changelist')
+
+    def run():
+        response = client.post(url, {'action': action, '_selected_action': ids})
+        assert response.status_code == 302, f'{action}: {response.status_code}'
+    return rolled_back(run)
+
+
+def _order_save():
+    user_id = User.objects.filter(username__startswith=f'{BENCH_PREFIX}_user_').values_list('id', flat=True).first()
+    product_id = Product.objects.filter(name__startswith=f'{BENCH_PREFIX}-').values_list('id', flat=True).first()
+
+    def run():
+        Order(user_id=user_id, product_id=product_id, quantity=2).save()
+    return rolled_back(run)
+
+
+def reserve_stock(product_id, amount=1):
+    """Зарезервировать товар так же, как это делает OrderAdmin.save_model"""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        return product.decrease_quantity(amount)
+
+
+def stock_reservation(threads, per_thread):
+    """N потоков одновременно резервируют один и тот же товар"""
+    product = Product.objects.filter(name__startswith=f'{BENCH_PREFIX}-').order_by('id').first()
+    original_quantity = product.quantity
+    # Через save(), а не update(), чтобы не сбить счётчики CategoryFacet
+    product.quantity = threads * per_thread
+    product.save(update_fields=['quantity'])
+
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        local = []
+        local_queries = []
+        failed = 0
+        try:
+            barrier.wait()
+            for _ in range(per_thread):
+                # connection - своё соединение у каждого потока, запросы считаются по потоку
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    try:
+                        if not reserve_stock(product.pk):
+                            failed += 1
+                    except Exception:
+                        failed += 1
+                    local.append(time.perf_counter() - start)
+                local_queries.append(len(ctx.captured_queries))
+        finally:
+            connection.close()
+            with lock:
+                latencies.extend(local)
+                queries.extend(local_queries)
+                errors.append(failed)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    wall_start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+
+    product = Product.objects.get(pk=product.pk)
+    remaining = product.quantity
+    product.quantity = original_quantity
+    product.save(update_fields=['quantity'])
+
+    result = summarize(latencies, queries, wall_time, errors=sum(errors))
+    result['threads'] = threads
+    # Потерянные обновления: каждое успешное резервирование обязано списать единицу
+    result['lost_updates'] = remaining - (threads * per_thread - (len(latencies) - sum(errors)))
+    return result
+
+
+def run_all(iterations=30, threads=8, batch=100, only=None):
+    """Прогнать все сценарии и вернуть отчёт"""
+    client = _client()
+    scenarios = {
+        'catalog_view': lambda: measure(_get(client, reverse('catalog')), iterations),
+        'main_view': lambda: measure(_get(client, reverse('main')), iterations),
+        'contacts_view': lambda: measure(_get(client, reverse('contacts')), iterations),
+        'payment_view': lambda: measure(_get(client, reverse('payment')), iterations),
+        'admin_product_changelist': lambda: measure(
+            _get(client, reverse('admin:Main_product_changelist')), iterations),
+        'admin_order_changelist': lambda: measure(
+            _get(client, reverse('admin:Main_order_changelist')), iterations),
+        'admin_order_add': lambda: measure(_get(client, reverse('admin:Main_order_add')), iterations),
+        'admin_product_autocomplete': lambda: measure(_get(
+            client,
+            reverse('admin:autocomplete')
+            + f'?app_label=Main&model_name=order&field_name=product&term={BENCH_PREFIX}-00001',
+        ), iterations),
+        'action_mark_as_paid': lambda: measure(
+            _bulk_action(client, 'mark_as_paid_action', 'NEW', batch), iterations),
+        'action_mark_as_shipped': lambda: measure(
+            _bulk_action(client, 'mark_as_shipped_action', 'PAID', batch), iterations),
+        'action_mark_as_delivered': lambda: measure(
+            _bulk_action(client, 'mark_as_delivered_action', 'SHIPPED', batch), iterations),
+        'action_cancel_order': lambda: measure(
+            _bulk_action(client, 'cancel_order_action', 'NEW', batch), iterations),
+        'order_save': lambda: measure(_order_save(), iterations),
+        'stock_reservation': lambda: stock_reservation(threads, iterations),
+    }
+
+    report = {
+        'meta': {
+            'vendor': connection.vendor,
+            'products': Product.objects.count(),
+            'orders': Order.objects.count(),
+            'iterations': iterations,
+            'threads': threads,
+            'batch': batch,
+        },
+        'scenarios': {},
+    }
+    for name, scenario in scenarios.items():
+        if only and name not in only:
+            continue
+        report['scenarios'][name] = scenario()
+    return report
+
+
+def compare(report, baseline, tolerance=0.25, min_delta_ms=5.0):
+    """Сравнить отчёт с базовой линией, вернуть список регрессий
+
+    Разница по времени меньше min_delta_ms считается шумом и не учитывается.
+    """
+    regressions = []
+    for name, base in baseline.get('scenarios', {}).items():
+        current = report['scenarios'].get(name)
+        if current is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if current[metric] - base[metric] < min_delta_ms:
+                continue
+            if current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {current[metric]} > {base[metric]} (+{tolerance:.0%})')
+        # Пропускная способность сравнивается через время на итерацию, с тем же порогом шума
+        slower_ms = (
+            1000 / current['throughput_per_s'] - 1000 / base['throughput_per_s']
+            if current['throughput_per_s'] and base['throughput_per_s'] else 0.0
+        )
+        if slower_ms >= min_delta_ms and current['throughput_per_s'] < base['throughput_per_s'] / (1 + tolerance):
+            regressions.append(
+                f"{name}: throughput_per_s {current['throughput_per_s']} < {base['throughput_per_s']} (-{tolerance:.0%})"
+            )
+        if current['queries'] > base['queries']:
+            regressions.append(f"{name}: queries {current['queries']} > {base['queries']}")
+        if current['errors'] > base['errors']:
+            regressions.append(f"{name}: errors {current['errors']} > {base['errors']}")
+    return regressions
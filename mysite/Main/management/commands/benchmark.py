@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Main.benchmarks import compare, run_all
+
+
+class Command(BaseCommand):
+    help = 'Замер пропускной способности, p50/p99 и количества SQL-запросов ключевых сценариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Повторов на сценарий')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков в сценарии резервирования товара')
+        parser.add_argument('--batch', type=int, default=100, help='Заказов в одном массовом действии')
+        parser.add_argument('--only', nargs='*', help='Запустить только указанные сценарии')
+        parser.add_argument('--output', help='Записать JSON-отчёт в файл')
+        parser.add_argument('--baseline', help='Сравнить с базовой линией и завершиться с ошибкой при регрессии')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое ухудшение времени (0.25 = 25%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Игнорировать разницу по времени меньше указанной')
+        parser.add_argument('--save-baseline', help='Сохранить результат как новую базовую линию')
+
+    def handle(self, *args, **options):
+        try:
+            report = run_all(
+                iterations=options['iterations'],
+                threads=options['threads'],
+                batch=options['batch'],
+                only=options['only'],
+            )
+        except Exception as e:
+            raise CommandError(f'Бенчмарк не выполнен (данные созданы командой seed_benchmark_data?): {e}')
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        self.stdout.write(text)
+        if options['output']:
+            Path(options['output']).write_text(text, encoding='utf-8')
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(text, encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f"Базовая линия сохранена: {options['save_baseline']}"))
+
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text(encoding='utf-8'))
+            regressions = compare(report, baseline, options['tolerance'], options['min_delta_ms'])
+            if regressions:
+                raise CommandError('Регрессии производительности:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базовой линии нет'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать рекомендации "часто покупают вместе" по новым и изменённым (отменённым) заказам с прошлого запуска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Игнорировать сохранённое состояние и пересчитать по всем заказам')
+        parser.add_argument('--top-k', type=int, help='Сколько рекомендаций хранить на товар (по умолчанию RECOMMENDATIONS_TOP_K)')
+
+    def handle(self, *args, **options):
+        try:
+            from Main.recommendations import build
+        except ImportError as e:
+            raise CommandError(f'Для рекомендаций нужны numpy и scipy: {e}')
+
+        run = build(full=options['full'], top_k=options['top_k'])
+        self.stdout.write(
+            f'Заказов обработано: {run.orders_processed} (до №{run.last_order_id})\n'
+            f'Товаров обновлено: {run.products_updated}\n'
+            f'Ненулевых элементов матрицы: {run.matrix_nnz}\n'
+            f'Матрица: {run.matrix_seconds:.2f} с, всего: {run.total_seconds:.2f} с\n'
+            f'Пик памяти (RSS): {run.peak_memory_mb:.1f} МБ'
+        )
+        self.stdout.write(self.style.SUCCESS('Рекомендации обновлены'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from Main.prerender import prerender_pages
+
+
+class Command(BaseCommand):
+    help = 'Отрендерить статичные страницы (main, contacts, payment) в PRERENDER_ROOT при деплое'
+
+    def add_arguments(self, parser):
+        parser.add_argument('templates', nargs='*', help='Шаблоны для пререндера (по умолчанию PRERENDER_TEMPLATES)')
+        parser.add_argument('--root', help='Каталог для файлов (по умолчанию PRERENDER_ROOT)')
+
+    def handle(self, *args, **options):
+        manifest = prerender_pages(options['templates'] or None, options['root'])
+        for template_name, entry in manifest.items():
+            self.stdout.write(f"{template_name}: {entry['size']} байт, ETag {entry['etag']}")
+        self.stdout.write(self.style.SUCCESS(f'Пререндер готов, страниц: {len(manifest)}'))
@@ -0,0 +1,135 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Скрипт выполняется в чистом дочернем процессе: в текущем процессе Django
+# уже загружен, и замер холодного старта был бы бессмысленным.
+BOOT_SCRIPT = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+t_settings = time.perf_counter()
+django.setup(set_prefix=False)
+t_apps = time.perf_counter()
+from django.core.handlers.wsgi import WSGIHandler
+application = WSGIHandler()
+t_handler = time.perf_counter()
+if getattr(settings, 'WARMUP_ON_STARTUP', False):
+    from mysite.startup import warm_up
+    warm_up()
+t_warmup = time.perf_counter()
+
+from wsgiref.util import setup_testing_defaults
+environ = {'PATH_INFO': sys.argv[1], 'HTTP_HOST': sys.argv[2]}
+setup_testing_defaults(environ)
+status = []
+body = b''.join(application(environ, lambda s, h, e=None: status.append(s)))
+t_first = time.perf_counter()
+print(json.dumps({
+    'settings': t_settings - t0,
+    'apps_ready': t_apps - t_settings,
+    'wsgi_handler': t_handler - t_apps,
+    'warmup': t_warmup - t_handler,
+    'first_request': t_first - t_warmup,
+    'time_to_first_response': t_first - t0,
+    'status': status[0] if status else None,
+    'bytes': len(body),
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """Разобрать вывод python -X importtime в список (глубина, self_us, cumulative_us, модуль)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        if not self_us.strip().isdigit():
+            continue  # строка заголовка
+        stripped = name.lstrip(' ')
+        depth = (len(name) - len(stripped) - 1) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), stripped.strip()))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Профилирование холодного старта: дерево времени импорта, время готовности приложений и первого запроса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help='URL первого запроса (по умолчанию /)')
+        parser.add_argument('--host', default='127.0.0.1', help='Заголовок Host первого запроса')
+        parser.add_argument('--runs', type=int, default=3, help='Количество холодных запусков (берётся медиана)')
+        parser.add_argument('--top', type=int, default=25, help='Сколько самых тяжёлых импортов показать')
+        parser.add_argument('--depth', type=int, default=2, help='Максимальная глубина дерева импорта')
+        parser.add_argument('--min-ms', type=float, default=5.0, help='Скрывать узлы дерева дешевле указанного времени')
+        parser.add_argument('--no-warmup', action='store_true', help='Отключить прогрев резолвера и шаблонов')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в формате JSON')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs должен быть не меньше 1')
+
+        env = dict(os.environ)
+        env['DJANGO_SETTINGS_MODULE'] = os.environ.get('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+        env['DJANGO_WARMUP_ON_STARTUP'] = '0' if options['no_warmup'] else '1'
+
+        runs = []
+        imports = []
+        for _ in range(options['runs']):
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT, options['path'], options['host']],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                raise CommandError(f'Дочерний процесс завершился с ошибкой:\n{result.stderr[-2000:]}')
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            imports = parse_importtime(result.stderr)
+
+        phases = ('settings', 'apps_ready', 'wsgi_handler', 'warmup', 'first_request', 'time_to_first_response')
+        report = {
+            'runs': len(runs),
+            'warmup': not options['no_warmup'],
+            'status': runs[-1]['status'],
+            'phases_ms': {
+                phase: round(statistics.median(run[phase] for run in runs) * 1000, 2)
+                for phase in phases
+            },
+            'top_imports_ms': [
+                {'module': name, 'self': round(self_us / 1000, 2), 'cumulative': round(cumulative_us / 1000, 2)}
+                for _, self_us, cumulative_us, name in sorted(imports, key=lambda row: row[2], reverse=True)[:options['top']]
+            ],
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"Холодный старт (медиана из {report['runs']}, прогрев: {'да' if report['warmup'] else 'нет'}, ответ: {report['status']})")
+        for phase, value in report['phases_ms'].items():
+            self.stdout.write(f'  {phase:<24} {value:>10.2f} мс')
+
+        self.stdout.write('\nДерево импорта (cumulative, мс):')
+        # -X importtime печатает дочерние модули раньше родителя, разворачиваем порядок
+        for depth, _, cumulative_us, name in reversed(imports):
+            if depth > options['depth'] or cumulative_us / 1000 < options['min_ms']:
+                continue
+            self.stdout.write(f"  {'  ' * depth}{name} {cumulative_us / 1000:.2f}")
+
+        self.stdout.write(f"\nСамые тяжёлые импорты (top {options['top']}):")
+        for row in report['top_imports_ms']:
+            self.stdout.write(f"  {row['cumulative']:>10.2f} мс  (self {row['self']:.2f})  {row['module']}")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Main.models import CategoryFacet
+
+
+class Command(BaseCommand):
+    help = 'Проверить и пересчитать счётчики товаров в наличии по категориям (CategoryFacet)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Только проверить, завершиться с ошибкой при расхождении')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            stored = CategoryFacet.counts()
+            actual = CategoryFacet.actual_counts()
+            drift = {code: (stored[code], actual[code]) for code in actual if stored[code] != actual[code]}
+            if drift:
+                lines = [f'{code}: {old} != {new}' for code, (old, new) in drift.items()]
+                raise CommandError('Счётчики категорий расходятся с товарами:\n' + '\n'.join(lines))
+            self.stdout.write(self.style.SUCCESS('Счётчики категорий согласованы'))
+            return
+
+        drift = CategoryFacet.rebuild()
+        for code, (old, new) in drift.items():
+            self.stdout.write(f'{code}: {old} -> {new}')
+        self.stdout.write(self.style.SUCCESS(f'Счётчики пересчитаны, исправлено: {len(drift)}'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from Main.benchmarks import SCALES, flush_benchmark_data, seed
+
+
+class Command(BaseCommand):
+    help = 'Создать детерминированные тестовые данные для бенчмарков (товары, покупатели, заказы)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='Готовый масштаб данных')
+        parser.add_argument('--products', type=int, help='Переопределить количество товаров')
+        parser.add_argument('--users', type=int, help='Переопределить количество покупателей')
+        parser.add_argument('--orders', type=int, help='Переопределить количество заказов')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument('--flush', action='store_true', help='Только удалить тестовые данные')
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            with transaction.atomic():
+                flush_benchmark_data()
+            self.stdout.write(self.style.SUCCESS('Тестовые данные удалены'))
+            return
+
+        sizes = dict(SCALES[options['scale']])
+        for key in sizes:
+            if options[key] is not None:
+                sizes[key] = options[key]
+        if sizes['products'] < 1 or sizes['users'] < 1:
+            raise CommandError('Нужен хотя бы один товар и один покупатель')
+
+        with transaction.atomic():
+            seed(seed=options['seed'], stdout=self.stdout, **sizes)
+        self.stdout.write(self.style.SUCCESS(f"Готово: {sizes}"))
@@ -0,0 +1,361 @@
+"""
+Метрики приложения в формате Prometheus.
+
+Счётчики, гистограммы и gauge живут в памяти процесса, обновление - это
+словарь под threading.Lock (около микросекунды). Если задан METRICS_DIR,
+каждый воркер не чаще раза в METRICS_FLUSH_INTERVAL секунд сбрасывает свой
+снимок в METRICS_DIR/metrics-<pid>-<метка процесса>.json (метка случайная,
+поэтому повторно выданный pid не перезапишет чужой снимок), а /metrics
+суммирует снимки всех воркеров. Снимки завершившихся процессов /metrics
+сливает в metrics-archived.json и удаляет: счётчики и гистограммы
+сохраняются (иначе Prometheus увидит сброс), gauge отбрасываются.
+Каталог нужно очищать при деплое.
+"""
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+try:
+    import fcntl
+except ImportError:  # Windows: снимки завершившихся процессов не архивируются
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Счётчик может только расти')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """Значение без меток вычисляется в момент снимка"""
+        self._function = function
+
+    def snapshot(self):
+        if self._function is not None:
+            return [[[], self._function()]]
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # Корзины хранятся без накопления, кумулятивные суммы считаются при выводе
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                [list(key), {'buckets': list(state['buckets']), 'sum': state['sum'], 'count': state['count']}]
+                for key, state in self._values.items()
+            ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        self._process = None
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+        self._metrics[metric.name] = metric
+
+    def process_id(self):
+        """pid и случайная метка процесса; после fork метка создаётся заново"""
+        pid = os.getpid()
+        if self._process is None or self._process[0] != pid:
+            self._process = (pid, uuid.uuid4().hex[:12])
+        return self._process
+
+    def snapshot(self):
+        """Снимок всех метрик процесса в виде, пригодном для JSON"""
+        return {
+            'pid': os.getpid(),
+            'metrics': {
+                name: {
+                    'type': metric.type,
+                    'help': metric.documentation,
+                    'labelnames': list(metric.labelnames),
+                    'buckets': list(getattr(metric, 'buckets', ())),
+                    'samples': metric.snapshot(),
+                }
+                for name, metric in self._metrics.items()
+            },
+        }
+
+    def flush(self, directory=None):
+        """Записать снимок процесса в METRICS_DIR (атомарно)"""
+        directory = directory or settings.METRICS_DIR
+        if not directory:
+            return
+        with self._flush_lock:
+            path = Path(directory)
+            path.mkdir(parents=True, exist_ok=True)
+            name = 'metrics-{}-{}.json'.format(*self.process_id())
+            target = path / name
+            tmp = path / f'.{name}.tmp'
+            tmp.write_text(json.dumps(self.snapshot()), encoding='utf-8')
+            os.replace(tmp, target)
+            self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """Сбросить снимок, если с прошлого раза прошло METRICS_FLUSH_INTERVAL секунд"""
+        if settings.METRICS_DIR and time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def collect(self, directory=None):
+        """Снимки всех процессов: из METRICS_DIR или только текущего"""
+        directory = directory or settings.METRICS_DIR
+        if not directory:
+            return [self.snapshot()]
+        self.flush(directory)
+        archive_dead_snapshots(directory)
+        snapshots = []
+        for path in sorted(Path(directory).glob('metrics-*.json')):
+            try:
+                snapshots.append(json.loads(path.read_text(encoding='utf-8')))
+            except (OSError, ValueError):
+                continue  # файл удалили или перезаписывают прямо сейчас
+        return snapshots
+
+    def render(self, directory=None):
+        return render_text(aggregate(self.collect(directory)))
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+ARCHIVE_NAME = 'metrics-archived.json'
+
+
+@contextmanager
+def _directory_lock(directory):
+    with open(Path(directory) / '.metrics.lock', 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _read_snapshot(path):
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def archive_dead_snapshots(directory):
+    """Слить снимки завершившихся процессов в metrics-archived.json и удалить их, вернуть число"""
+    if fcntl is None:
+        return 0
+    directory = Path(directory)
+    # Блокировка: два воркера не должны заархивировать один снимок дважды
+    with _directory_lock(directory):
+        dead = []
+        for path in directory.glob('metrics-*.json'):
+            if path.name == ARCHIVE_NAME:
+                continue
+            snapshot = _read_snapshot(path)
+            if snapshot is not None and not _pid_alive(snapshot['pid']):
+                dead.append((path, snapshot))
+        if not dead:
+            return 0
+
+        archive = directory / ARCHIVE_NAME
+        previous = _read_snapshot(archive)
+        merged = aggregate(([previous] if previous else []) + [snapshot for _, snapshot in dead])
+        archived = {
+            'pid': None,
+            'metrics': {
+                name: dict(metric, samples=[[list(key), value] for key, value in metric['samples'].items()])
+                for name, metric in merged.items()
+            },
+        }
+        tmp = directory / f'.{ARCHIVE_NAME}.tmp'
+        tmp.write_text(json.dumps(archived), encoding='utf-8')
+        os.replace(tmp, archive)
+        for path, _ in dead:
+            path.unlink(missing_ok=True)
+    return len(dead)
+
+
+def aggregate(snapshots):
+    """Сложить снимки процессов: счётчики и гистограммы суммируются, gauge - только живых процессов"""
+    merged = {}
+    for snapshot in snapshots:
+        # pid=None - архив завершившихся процессов
+        alive = snapshot['pid'] is not None and _pid_alive(snapshot['pid'])
+        for name, metric in snapshot['metrics'].items():
+            if metric['type'] == 'gauge' and not alive:
+                continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                if metric['type'] == 'histogram':
+                    state = target['samples'].setdefault(
+                        key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                    state['buckets'] = [a + b for a, b in zip(state['buckets'], value['buckets'])]
+                    state['sum'] += value['sum']
+                    state['count'] += value['count']
+                else:
+                    target['samples'][key] = target['samples'].get(key, 0) + value
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_text(merged):
+    """Текстовый формат Prometheus 0.0.4"""
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key in sorted(metric['samples']):
+            value = metric['samples'][key]
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                bounds = list(metric['buckets']) + [math.inf]
+                for bound, count in zip(bounds, value['buckets']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(metric['labelnames'], key, [('le', _number(float(bound)))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(metric['labelnames'], key)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(metric['labelnames'], key)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(metric['labelnames'], key)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# ------------------------------------------------------------------
+# Метрики приложения
+# ------------------------------------------------------------------
+
+ORDER_EVENTS = Counter(
+    'mysite_orders_total', 'Созданные заказы и переходы статуса (по новому статусу)', ['status'])
+STOCK_RESERVATIONS = Counter(
+    'mysite_stock_reservations_total', 'Попытки резервирования товара на складе', ['source', 'result'])
+ADMIN_ACTIONS = Counter(
+    'mysite_admin_actions_total', 'Заказы, обработанные массовыми действиями OrderAdmin', ['action', 'result'])
+PRERENDER_CACHE = Counter(
+    'mysite_prerender_cache_total', 'Обращения к пререндеру статичных страниц', ['result'])
+HTTP_REQUESTS = Counter(
+    'mysite_http_requests_total', 'HTTP-запросы', ['view', 'method', 'status'])
+HTTP_LATENCY = Histogram(
+    'mysite_http_request_duration_seconds', 'Время обработки HTTP-запроса', ['view', 'method'])
+DB_CONNECTIONS_OPENED = Counter(
+    'mysite_db_connections_opened_total', 'Открытые соединения с БД (рост = соединения не переиспользуются)', ['alias'])
+DB_CONNECTIONS_OPEN = Gauge(
+    'mysite_db_connections_open', 'Соединения с БД, открытые сейчас во всех потоках')
+
+# Соединения Django живут по одному на поток, поэтому отслеживаем их через сигнал
+_open_connections = weakref.WeakSet()
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _open_connections.add(connection)
+    DB_CONNECTIONS_OPENED.inc(alias=connection.alias)
+
+
+connection_created.connect(_on_connection_created, dispatch_uid='mysite_metrics_connection_created')
+DB_CONNECTIONS_OPEN.set_function(
+    lambda: sum(1 for wrapper in list(_open_connections) if wrapper.connection is not None)
+)
+atexit.register(REGISTRY.flush)
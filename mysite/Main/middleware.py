@@ -0,0 +1,23 @@
+import time
+
+from .metrics import HTTP_LATENCY, HTTP_REQUESTS, REGISTRY
+
+
+class MetricsMiddleware:
+    """Время обработки и количество запросов по view (ставится первым в MIDDLEWARE)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # Метка - имя маршрута, а не путь: иначе число рядов растёт с каждым URL
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        HTTP_LATENCY.observe(duration, view=view, method=request.method)
+        HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        REGISTRY.maybe_flush()
+        return response
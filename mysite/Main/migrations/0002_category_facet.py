@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:37
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_category_facets(apps, schema_editor):
+    Product = apps.get_model('Main', 'Product')
+    CategoryFacet = apps.get_model('Main', 'CategoryFacet')
+    totals = dict(
+        Product.objects.filter(is_active=True, quantity__gt=0, category__isnull=False)
+        .values('category').annotate(total=Count('id')).values_list('category', 'total')
+    )
+    CategoryFacet.objects.bulk_create([
+        CategoryFacet(category=code, in_stock=totals.get(code, 0))
+        for code, _ in Product._meta.get_field('category').choices
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('category', models.CharField(choices=[('MONO', 'моно_букеты'), ('MIXED', 'сборные_букеты'), ('GIFT', 'подарочные_наборы'), ('COMP', 'композиции'), ('WEDDING', 'свадебные_букеты'), ('BUSINESS', 'деловые_букеты')], max_length=20, primary_key=True, serialize=False, verbose_name='Категория')),
+                ('in_stock', models.IntegerField(default=0, verbose_name='В наличии')),
+            ],
+            options={
+                'verbose_name': 'Счётчик категории',
+                'verbose_name_plural': 'Счётчики категорий',
+            },
+        ),
+        migrations.RunPython(fill_category_facets, migrations.RunPython.noop),
+    ]
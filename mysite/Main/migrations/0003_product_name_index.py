@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0002_category_facet'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='Название'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Main', '0003_product_name_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата запуска')),
+                ('last_order_id', models.BigIntegerField(verbose_name='Последний обработанный заказ')),
+                ('orders_processed', models.PositiveIntegerField(verbose_name='Обработано заказов')),
+                ('products_updated', models.PositiveIntegerField(verbose_name='Обновлено товаров')),
+                ('matrix_nnz', models.BigIntegerField(verbose_name='Ненулевых элементов матрицы')),
+                ('matrix_seconds', models.FloatField(verbose_name='Построение матрицы, с')),
+                ('total_seconds', models.FloatField(verbose_name='Всего, с')),
+                ('peak_memory_mb', models.FloatField(verbose_name='Пик памяти, МБ')),
+            ],
+            options={
+                'verbose_name': 'Запуск рекомендаций',
+                'verbose_name_plural': 'Запуски рекомендаций',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.PositiveIntegerField(verbose_name='Совместных покупателей')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='Main.product', verbose_name='Товар')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_in', to='Main.product', verbose_name='Рекомендуемый товар')),
+            ],
+            options={
+                'verbose_name': 'Рекомендация',
+                'verbose_name_plural': 'Рекомендации',
+                'ordering': ['product', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='unique_product_recommendation_rank')],
+            },
+        ),
+    ]
@@ -1,7 +1,16 @@
-from django.db import models
+from functools import partial
+
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
 from django.core.validators import MinValueValidator
 from django.conf import settings
 
+from .metrics import ORDER_EVENTS, STOCK_RESERVATIONS
+
+FACET_FIELDS = ('category', 'is_active', 'quantity')
+
 class Product(models.Model):
     CATEGORY_CHOICES = [
         ('MONO', 'моно_букеты'), 
@@ -13,7 +22,7 @@ class Product(models.Model):
     ]
     
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, verbose_name="Категория", null=True, blank=True)
-    name = models.CharField(max_length=255, verbose_name="Название")
+    name = models.CharField(max_length=255, verbose_name="Название", db_index=True)
     description = models.TextField(verbose_name="Описание", blank=True, null=True)  # ← ДОБАВЛЕНО
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, verbose_name="Цена")
     quantity = models.PositiveIntegerField(default=0, verbose_name="Склад")
@@ -28,6 +37,46 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} (осталось: {self.quantity})"
     
+    # Этот метод возвращает категорию, в счётчике которой учитывается товар (активен и есть на складе).
+    def facet_category(self):
+        """Категория для счётчика фасетов или None"""
+        if self.category and self.is_active and self.quantity > 0:
+            return self.category
+        return None
+    
+    @staticmethod
+    def locked_facet_row(pk):
+        """Поля фасета из строки в БД (dict или None), строка блокируется до конца транзакции"""
+        return Product.objects.select_for_update().filter(pk=pk).values(*FACET_FIELDS).first()
+    
+    @staticmethod
+    def facet_of(row):
+        """Фасет по словарю полей FACET_FIELDS"""
+        return Product(**row).facet_category() if row else None
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not set(update_fields).intersection(FACET_FIELDS):
+            super().save(*args, **kwargs)
+            return
+        
+        # savepoint=False: внутри атомарных блоков админки не плодим лишние SAVEPOINT
+        with transaction.atomic(savepoint=False):
+            # Старое состояние читаем из БД под блокировкой строки, а не из экземпляра:
+            # два устаревших экземпляра одного товара иначе сдвинули бы счётчик дважды
+            row = None if self._state.adding or self.pk is None else Product.locked_facet_row(self.pk)
+            super().save(*args, **kwargs)
+            if update_fields is None or row is None:
+                new = self.facet_category()
+            else:
+                # Записаны только update_fields, остальные поля фасета в БД остались как в строке
+                written = set(update_fields)
+                new = Product.facet_of({
+                    field: getattr(self, field) if field in written else value
+                    for field, value in row.items()
+                })
+            CategoryFacet.move(Product.facet_of(row), new)
+    
     # Этот метод возвращает название категории товара с решёткой в начале, используя встроенный метод Django.
     def get_category_display_with_hash(self):
         """Получить категорию с #"""
@@ -45,9 +94,27 @@ class Product(models.Model):
         if self.quantity >= amount:
             self.quantity -= amount
             self.save()
+            # Успешное резервирование считаем после коммита: откат не должен попадать в метрику
+            transaction.on_commit(partial(STOCK_RESERVATIONS.inc, source='model', result='ok'))
             return True
+        STOCK_RESERVATIONS.inc(source='model', result='insufficient')
         return False
     
+    # Этот метод возвращает товары, которые чаще всего покупают вместе с этим (считает build_recommendations).
+    def recommended_products(self, limit=None):
+        """Часто покупают вместе: активные товары в порядке рейтинга"""
+        return Product.recommended_for(self.pk, limit)
+    
+    @classmethod
+    def recommended_for(cls, product_id, limit=None):
+        """Рекомендации по id товара одним запросом по индексу (product, rank)"""
+        queryset = cls.objects.filter(
+            recommended_in__product_id=product_id, is_active=True
+        ).order_by('recommended_in__rank')
+        if limit:
+            queryset = queryset[:limit]
+        return queryset
+    
     # Этот метод увеличивает количество товара на указанное значение и сохраняет изменения в базе данных.
     def increase_quantity(self, amount=1):
         """Увеличить количество товара"""
@@ -92,6 +159,12 @@ class Order(models.Model):
         auto_now_add=True, 
         verbose_name="Дата создания"
         )
+    # По нему build_recommendations находит заказы, отменённые после прошлого запуска
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name="Дата изменения"
+        )
     total_price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -111,4 +184,128 @@ class Order(models.Model):
         # Вычисляем общую стоимость
         if self.product:
             self.total_price = self.product.price * self.quantity
-        super().save(*args, **kwargs)
\ No newline at end of file
+        update_fields = kwargs.get('update_fields')
+        status_changed = self._state.adding or (update_fields is not None and 'status' in update_fields)
+        if update_fields is not None:
+            # auto_now записывается, только если поле есть в update_fields
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+        if status_changed:
+            transaction.on_commit(partial(ORDER_EVENTS.inc, status=self.status))
+
+
+class CategoryFacet(models.Model):
+    """
+    Количество активных товаров в наличии по категориям для фильтров каталога.
+
+    Счётчик сдвигается в Product.save(), когда категория, is_active или
+    переход quantity через ноль меняют фасет товара, и при удалении товара
+    (сигналы pre_delete/post_delete, в том числе для QuerySet.delete() и
+    массового удаления в админке). Массовые QuerySet.update()/bulk_create()
+    его обходят - после них нужна команда rebuild_category_facets.
+    """
+    category = models.CharField(max_length=20, primary_key=True, choices=Product.CATEGORY_CHOICES, verbose_name="Категория")
+    in_stock = models.IntegerField(default=0, verbose_name="В наличии")
+
+    class Meta:
+        verbose_name = "Счётчик категории"
+        verbose_name_plural = "Счётчики категорий"
+
+    def __str__(self):
+        return f"{self.get_category_display()}: {self.in_stock}"
+
+    @classmethod
+    def move(cls, old, new):
+        """Перенести товар из фасета old в фасет new (None - товар не учитывается)"""
+        if old == new:
+            return
+        if old is not None:
+            cls.objects.filter(category=old).update(in_stock=F('in_stock') - 1)
+        if new is not None:
+            if not cls.objects.filter(category=new).update(in_stock=F('in_stock') + 1):
+                cls.objects.create(category=new, in_stock=1)
+
+    @classmethod
+    def counts(cls):
+        """Счётчики всех категорий в порядке CATEGORY_CHOICES"""
+        stored = dict(cls.objects.values_list('category', 'in_stock'))
+        return {code: stored.get(code, 0) for code, _ in Product.CATEGORY_CHOICES}
+
+    @staticmethod
+    def actual_counts():
+        """Посчитать фасеты заново по таблице товаров (GROUP BY)"""
+        rows = (
+            Product.objects.filter(is_active=True, quantity__gt=0, category__isnull=False)
+            .values('category').annotate(total=Count('id')).values_list('category', 'total')
+        )
+        stored = dict(rows)
+        return {code: stored.get(code, 0) for code, _ in Product.CATEGORY_CHOICES}
+
+    @classmethod
+    def rebuild(cls):
+        """Перезаписать счётчики фактическими значениями, вернуть расхождения {категория: (было, стало)}"""
+        with transaction.atomic():
+            current = {
+                facet.category: facet.in_stock
+                for facet in cls.objects.select_for_update()
+            }
+            actual = cls.actual_counts()
+            drift = {}
+            for category, total in actual.items():
+                if current.get(category) != total:
+                    drift[category] = (current.get(category), total)
+                    cls.objects.update_or_create(category=category, defaults={'in_stock': total})
+        return drift
+
+
+class ProductRecommendation(models.Model):
+    """Топ-K товаров, которые покупают вместе с product (Main.recommendations)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations', verbose_name="Товар")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_in', verbose_name="Рекомендуемый товар")
+    rank = models.PositiveSmallIntegerField(verbose_name="Место")
+    score = models.PositiveIntegerField(verbose_name="Совместных покупателей")
+
+    class Meta:
+        verbose_name = "Рекомендация"
+        verbose_name_plural = "Рекомендации"
+        ordering = ['product', 'rank']
+        constraints = [
+            # Индекс (product, rank) обслуживает выборку рекомендаций одного товара
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_product_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} (#{self.rank})"
+
+
+class RecommendationRun(models.Model):
+    """Журнал запусков build_recommendations: до какого заказа обработано и сколько это стоило"""
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата запуска")
+    last_order_id = models.BigIntegerField(verbose_name="Последний обработанный заказ")
+    orders_processed = models.PositiveIntegerField(verbose_name="Обработано заказов")
+    products_updated = models.PositiveIntegerField(verbose_name="Обновлено товаров")
+    matrix_nnz = models.BigIntegerField(verbose_name="Ненулевых элементов матрицы")
+    matrix_seconds = models.FloatField(verbose_name="Построение матрицы, с")
+    total_seconds = models.FloatField(verbose_name="Всего, с")
+    peak_memory_mb = models.FloatField(verbose_name="Пик памяти, МБ")
+
+    class Meta:
+        verbose_name = "Запуск рекомендаций"
+        verbose_name_plural = "Запуски рекомендаций"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Запуск №{self.id}: {self.orders_processed} заказов за {self.total_seconds:.1f} с"
+
+
+# Сигналы, а не Product.delete(): QuerySet.delete() и действие админки
+# "Удалить выбранные" метод модели не вызывают
+@receiver(pre_delete, sender=Product, dispatch_uid='main_product_facet_pre_delete')
+def _product_facet_pre_delete(sender, instance, **kwargs):
+    # Collector удаляет внутри транзакции, блокировка держится до post_delete
+    instance._facet_category_deleted = Product.facet_of(Product.locked_facet_row(instance.pk))
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='main_product_facet_post_delete')
+def _product_facet_post_delete(sender, instance, **kwargs):
+    CategoryFacet.move(getattr(instance, '_facet_category_deleted', None), None)
@@ -0,0 +1,156 @@
+"""
+Пререндер статичных страниц.
+
+main.html, contacts.html и payment.html не зависят от запроса, поэтому
+команда prerender_pages рендерит их один раз при деплое в PRERENDER_ROOT
+(обычный и gzip-вариант + manifest.json). Декоратор prerendered отдаёт
+готовые байты с ETag и Cache-Control, а живой рендер выполняется только
+если шаблон или манифест статики изменились после пререндера.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from .metrics import PRERENDER_CACHE
+
+MANIFEST_NAME = 'manifest.json'
+
+# Загруженные страницы: имя шаблона -> (отпечаток, PrerenderedPage)
+_pages = {}
+
+
+class PrerenderedPage:
+    def __init__(self, body, gzipped, etag):
+        self.body = body
+        self.gzipped = gzipped
+        self.etag = etag
+
+    @property
+    def gzip_etag(self):
+        return self.etag[:-1] + '-gz"'
+
+
+def static_manifest_bytes():
+    """Содержимое манифеста collectstatic (ManifestStaticFilesStorage), если он есть"""
+    if not settings.STATIC_ROOT:
+        return b''
+    path = Path(settings.STATIC_ROOT) / 'staticfiles.json'
+    try:
+        return path.read_bytes()
+    except OSError:
+        return b''
+
+
+def fingerprint(template_name):
+    """Отпечаток исходников страницы: шаблон + STATIC_URL + манифест статики"""
+    digest = hashlib.sha256()
+    digest.update(get_template(template_name).template.source.encode('utf-8'))
+    digest.update(str(settings.STATIC_URL).encode('utf-8'))
+    digest.update(static_manifest_bytes())
+    return digest.hexdigest()
+
+
+def _page_file(template_name):
+    return Path(template_name).name
+
+
+def prerender_pages(template_names=None, root=None):
+    """Отрендерить страницы в файлы и записать manifest.json, вернуть манифест"""
+    if template_names is None:
+        template_names = settings.PRERENDER_TEMPLATES
+    root = Path(root) if root is not None else Path(settings.PRERENDER_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+
+    manifest = {}
+    for template_name in template_names:
+        body = render_to_string(template_name).encode('utf-8')
+        filename = _page_file(template_name)
+        (root / filename).write_bytes(body)
+        # mtime=0 делает gzip детерминированным, файл не меняется между деплоями
+        (root / f'{filename}.gz').write_bytes(gzip.compress(body, compresslevel=9, mtime=0))
+        manifest[template_name] = {
+            'file': filename,
+            'fingerprint': fingerprint(template_name),
+            'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            'size': len(body),
+        }
+
+    tmp = root / f'{MANIFEST_NAME}.tmp'
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp, root / MANIFEST_NAME)
+    _pages.clear()
+    return manifest
+
+
+def load_page(template_name):
+    """Вернуть пререндер страницы или None, если его нет или он устарел"""
+    current = fingerprint(template_name)
+    cached = _pages.get(template_name)
+    if cached is not None and cached[0] == current:
+        return cached[1]
+
+    root = Path(settings.PRERENDER_ROOT)
+    try:
+        manifest = json.loads((root / MANIFEST_NAME).read_text(encoding='utf-8'))
+        entry = manifest[template_name]
+        page = None
+        if entry['fingerprint'] == current:
+            page = PrerenderedPage(
+                (root / entry['file']).read_bytes(),
+                (root / f"{entry['file']}.gz").read_bytes(),
+                entry['etag'],
+            )
+    except (OSError, ValueError, KeyError):
+        page = None
+    # Промах не запоминаем: prerender_pages может выполниться уже после
+    # старта воркеров, и страница должна подхватиться без перезапуска
+    if page is not None:
+        _pages[template_name] = (current, page)
+    return page
+
+
+def _cached_page(template_name):
+    # Без DEBUG шаблоны не меняются до перезапуска, отпечаток считается один раз
+    cached = _pages.get(template_name)
+    if not settings.DEBUG and cached is not None:
+        return cached[1]
+    return load_page(template_name)
+
+
+def prerendered(template_name):
+    """Отдавать страницу из пререндера, если он актуален, иначе вызвать view"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page = None
+            if settings.PRERENDER_ENABLED and request.method in ('GET', 'HEAD'):
+                page = _cached_page(template_name)
+                PRERENDER_CACHE.inc(result='hit' if page is not None else 'miss')
+            if page is None:
+                return view(request, *args, **kwargs)
+
+            use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+            etag = page.gzip_etag if use_gzip else page.etag
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+            if if_none_match and etag in parse_etags(if_none_match):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(page.gzipped if use_gzip else page.body, content_type='text/html; charset=utf-8')
+                if use_gzip:
+                    response['Content-Encoding'] = 'gzip'
+            response['ETag'] = etag
+            response['Cache-Control'] = f'public, max-age={settings.PRERENDER_MAX_AGE}'
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        return wrapper
+    return decorator
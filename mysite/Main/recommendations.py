@@ -0,0 +1,307 @@
+"""
+Рекомендации "часто покупают вместе".
+
+Офлайн-задача (manage.py build_recommendations) строит разреженную матрицу
+совместных покупок C = A^T A, где A - бинарная матрица покупатель x товар
+по заказам. C[i, j] - сколько покупателей купили и i, и j, на диагонали -
+число покупателей товара. C, A, номер последнего обработанного заказа и
+время прошлого запуска хранятся в RECOMMENDATIONS_STATE_PATH, поэтому
+следующий запуск читает только затронутых покупателей: с новыми заказами
+и с заказами, изменёнными после прошлого запуска (Order.updated_at, так
+ловятся отмены). Для них к C прибавляется A_new^T A_new - A_old^T A_old,
+где A_old берётся из сохранённого состояния, и перезаписываются только
+товары, у которых изменился топ-K. Топ-K пишется в ProductRecommendation
+и читается одним индексированным запросом (Product.recommended_products).
+
+Удаление заказов и QuerySet.update() инкрементальный запуск не видит,
+поэтому раз в RECOMMENDATIONS_FULL_REBUILD_DAYS дней build() сам
+пересчитывает всё с нуля (как --full).
+
+Требует numpy и scipy, они импортируются только здесь.
+"""
+
+import os
+import sys
+import time
+from array import array
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Order, ProductRecommendation, RecommendationRun
+
+CHUNK_SIZE = 20_000
+
+
+def _state_path():
+    return Path(settings.RECOMMENDATIONS_STATE_PATH)
+
+
+class State:
+    """Сохранённое состояние: C, A, последний заказ и время запусков (unix time)"""
+
+    def __init__(self, matrix=None, purchases=None, last_order_id=0, changed_since=None, full_at=None):
+        self.matrix = matrix
+        self.purchases = purchases
+        self.last_order_id = last_order_id
+        self.changed_since = changed_since
+        self.full_at = full_at
+
+    @property
+    def empty(self):
+        return self.matrix is None or self.purchases is None
+
+
+def load_state():
+    """Загрузить State (пустой, если файла нет или он старого формата)"""
+    path = _state_path()
+    if not path.exists():
+        return State()
+    with np.load(path) as state:
+        if 'purchases_indptr' not in state.files:
+            return State()
+        matrix = sparse.csr_matrix(
+            (state['data'], state['indices'], state['indptr']),
+            shape=tuple(state['shape']),
+        )
+        indices = state['purchases_indices']
+        purchases = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, state['purchases_indptr']),
+            shape=tuple(state['purchases_shape']),
+        )
+        return State(
+            matrix, purchases, int(state['last_order_id']),
+            float(state['changed_since']), float(state['full_at']),
+        )
+
+
+def save_state(state):
+    path = _state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as fh:
+        np.savez(
+            fh,
+            data=state.matrix.data,
+            indices=state.matrix.indices,
+            indptr=state.matrix.indptr,
+            shape=np.array(state.matrix.shape),
+            # A бинарная, значения не храним
+            purchases_indices=state.purchases.indices,
+            purchases_indptr=state.purchases.indptr,
+            purchases_shape=np.array(state.purchases.shape),
+            last_order_id=np.array(state.last_order_id),
+            changed_since=np.array(state.changed_since),
+            full_at=np.array(state.full_at),
+        )
+    os.replace(tmp, path)
+
+
+def _order_arrays(queryset):
+    """Прочитать (id, user_id, product_id) заказов в numpy-массивы без списка кортежей"""
+    ids, users, products = array('q'), array('q'), array('q')
+    for order_id, user_id, product_id in queryset.values_list('id', 'user_id', 'product_id').iterator(chunk_size=CHUNK_SIZE):
+        ids.append(order_id)
+        users.append(user_id)
+        products.append(product_id)
+    return (
+        np.frombuffer(ids, dtype=np.int64),
+        np.frombuffer(users, dtype=np.int64),
+        np.frombuffer(products, dtype=np.int64),
+    )
+
+
+def _counted_orders():
+    # Отменённые заказы не считаются покупкой
+    return Order.objects.exclude(status='CANCELED').order_by()
+
+
+def _incidence(user_rows, product_ids, n_users, n_products):
+    """Бинарная матрица покупатель x товар"""
+    matrix = sparse.csr_matrix(
+        (np.ones(len(user_rows), dtype=np.int32), (user_rows, product_ids)),
+        shape=(n_users, n_products),
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def _resize(matrix, rows, cols):
+    if matrix.shape != (rows, cols):
+        matrix = matrix.tocoo()
+        matrix = sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)), shape=(rows, cols))
+    return matrix
+
+
+def _changed_users(last_order_id, changed_since):
+    """Покупатели, у которых после changed_since менялись уже обработанные заказы"""
+    since = datetime.fromtimestamp(changed_since, tz=dt_timezone.utc)
+    # Только условие по updated_at и без DISTINCT: иначе SQLite выбирает индекс
+    # user_id или первичный ключ и читает всю таблицу заказов
+    rows = Order.objects.filter(updated_at__gte=since).order_by().values_list('id', 'user_id')
+    ids, users = array('q'), array('q')
+    for order_id, user_id in rows.iterator(chunk_size=CHUNK_SIZE):
+        ids.append(order_id)
+        users.append(user_id)
+    ids = np.frombuffer(ids, dtype=np.int64)
+    users = np.frombuffer(users, dtype=np.int64)
+    return np.unique(users[ids <= last_order_id])
+
+
+def update_matrix(state, top_k):
+    """
+    Учесть в состоянии заказы после state.last_order_id и изменённые заказы.
+
+    Возвращает (новых заказов, {товар: новый топ-K}). В словарь попадают
+    только товары, у которых топ-K действительно изменился.
+    """
+    new_ids, new_users, new_products = _order_arrays(_counted_orders().filter(id__gt=state.last_order_id))
+    last_order_id = int(new_ids.max()) if len(new_ids) else state.last_order_id
+    incremental = not state.empty
+
+    users, products = new_users, new_products
+    affected_users = np.unique(new_users)
+    if incremental:
+        changed = _changed_users(state.last_order_id, state.changed_since)
+        affected_users = np.union1d(affected_users, changed)
+        # Текущие заказы затронутых покупателей до прошлой отметки
+        old_parts = [(users, products)]
+        for start in range(0, len(affected_users), 1000):
+            chunk = affected_users[start:start + 1000].tolist()
+            _, chunk_users, chunk_products = _order_arrays(
+                _counted_orders().filter(id__lte=state.last_order_id, user_id__in=chunk)
+            )
+            old_parts.append((chunk_users, chunk_products))
+        users = np.concatenate([part[0] for part in old_parts])
+        products = np.concatenate([part[1] for part in old_parts])
+    if not len(affected_users):
+        state.last_order_id = last_order_id
+        return 0, {}
+
+    size = int(products.max()) + 1 if len(products) else 0
+    rows = int(affected_users.max()) + 1
+    if not incremental:
+        state.matrix = sparse.csr_matrix((size, size), dtype=np.int32)
+        state.purchases = sparse.csr_matrix((rows, size), dtype=np.int32)
+    size = max(size, state.matrix.shape[0])
+    rows = max(rows, state.purchases.shape[0])
+    state.matrix = _resize(state.matrix, size, size)
+    state.purchases = _resize(state.purchases, rows, size)
+
+    # Строки A - id покупателей. before - их строки из сохранённой A (а не
+    # из текущих статусов в БД), after - их заказы сейчас
+    mask = np.zeros(rows, dtype=np.int32)
+    mask[affected_users] = 1
+    before = (sparse.diags(mask, dtype=np.int32) @ state.purchases).tocsr()
+    after = _incidence(users, products, rows, size)
+
+    delta = (after.T @ after - before.T @ before).tocsr()
+    delta.eliminate_zeros()
+    changed_products = np.unique(delta.tocoo().row)
+    # Новые совместные покупки часто не меняют топ-K, такие товары не перезаписываем
+    previous = top_related(state.matrix, changed_products, top_k) if incremental else {}
+    state.matrix = (state.matrix + delta).tocsr()
+    state.matrix.eliminate_zeros()
+    state.purchases = (state.purchases - before + after).tocsr()
+    state.purchases.eliminate_zeros()
+    state.last_order_id = last_order_id
+
+    related = {
+        product_id: items
+        for product_id, items in top_related(state.matrix, changed_products, top_k).items()
+        if previous.get(product_id) != items
+    }
+    return len(new_ids), related
+
+
+def top_related(matrix, product_ids, top_k):
+    """Топ-K товаров по числу совместных покупок для каждого из product_ids"""
+    result = {}
+    for product_id in product_ids:
+        start, end = matrix.indptr[product_id], matrix.indptr[product_id + 1]
+        cols = matrix.indices[start:end]
+        vals = matrix.data[start:end]
+        mask = cols != product_id
+        cols, vals = cols[mask], vals[mask]
+        # По убыванию числа покупок, при равенстве - по id товара
+        order = np.lexsort((cols, -vals))[:top_k]
+        result[int(product_id)] = list(zip(cols[order].tolist(), vals[order].tolist()))
+    return result
+
+
+def write_recommendations(related):
+    """Заменить топ-K изменившихся товаров в ProductRecommendation"""
+    product_ids = list(related)
+    for start in range(0, len(product_ids), 1000):
+        ProductRecommendation.objects.filter(product_id__in=product_ids[start:start + 1000]).delete()
+
+    # До миллиона строк за запуск: executemany без создания объектов модели
+    # быстрее bulk_create примерно на порядок
+    opts = ProductRecommendation._meta
+    columns = [opts.get_field(name).column for name in ('product', 'recommended', 'rank', 'score')]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    rows = [
+        (product_id, recommended_id, rank, score)
+        for product_id, items in related.items()
+        for rank, (recommended_id, score) in enumerate(items, start=1)
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), 10_000):
+            cursor.executemany(sql, rows[start:start + 10_000])
+
+
+def peak_memory_mb():
+    """Пиковый RSS процесса в МБ (0, если платформа не поддерживает resource)"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def build(full=False, top_k=None):
+    """Обработать новые и изменённые заказы и обновить рекомендации, вернуть RecommendationRun"""
+    top_k = top_k or settings.RECOMMENDATIONS_TOP_K
+    started = time.perf_counter()
+    # Отметка ставится до чтения заказов: изменённые во время запуска попадут в следующий
+    run_at = time.time()
+    state = State() if full else load_state()
+    max_age = settings.RECOMMENDATIONS_FULL_REBUILD_DAYS * 86400
+    if not state.empty and run_at - state.full_at >= max_age:
+        state = State()
+    full = state.empty
+    processed, related = update_matrix(state, top_k)
+    matrix_time = time.perf_counter() - started
+
+    with transaction.atomic():
+        if full:
+            ProductRecommendation.objects.all().delete()
+        write_recommendations(related)
+        run = RecommendationRun.objects.create(
+            last_order_id=state.last_order_id,
+            orders_processed=processed,
+            products_updated=len(related),
+            matrix_nnz=state.matrix.nnz if state.matrix is not None else 0,
+            matrix_seconds=matrix_time,
+            total_seconds=time.perf_counter() - started,
+            peak_memory_mb=peak_memory_mb(),
+        )
+    # Состояние сохраняется после коммита: при сбое между ними заказы
+    # будут обработаны повторно от старого состояния, без двойного счёта
+    if state.matrix is not None:
+        state.changed_since = run_at
+        state.full_at = run_at if full else state.full_at
+        save_state(state)
+    return run
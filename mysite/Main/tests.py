@@ -1,3 +1,477 @@
-from django.test import TestCase
+import gzip
+import importlib.util
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from Main import metrics, prerender
+from Main.benchmarks import compare, percentile, run_all, seed
+from Main.management.commands.profile_startup import parse_importtime
+from Main.models import CategoryFacet, Order, Product
+from mysite.startup import warm_up, warm_up_templates
+
+
+class StartupTests(TestCase):
+    def test_parse_importtime(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   child\n"
+            "import time:       300 |        420 | parent\n"
+        )
+        self.assertEqual(parse_importtime(stderr), [
+            (1, 120, 120, 'child'),
+            (0, 300, 420, 'parent'),
+        ])
+
+    def test_warm_up(self):
+        timings = warm_up()
+        self.assertEqual(set(timings), {'urls', 'templates'})
+        self.assertEqual(warm_up_templates(['main.html', 'missing.html']), ['main.html'])
+
+
+class BenchmarkTests(TestCase):
+    def test_percentile(self):
+        values = [0.001 * i for i in range(1, 101)]
+        self.assertAlmostEqual(percentile(values, 50), 0.05)
+        self.assertAlmostEqual(percentile(values, 99), 0.099)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_compare_detects_regressions(self):
+        base = {'scenarios': {'order_save': {
+            'p50_ms': 10.0, 'p99_ms': 20.0, 'throughput_per_s': 100.0, 'queries': 4, 'errors': 0,
+        }}}
+        same = {'scenarios': {'order_save': dict(base['scenarios']['order_save'], p99_ms=22.0)}}
+        self.assertEqual(compare(same, base, tolerance=0.25), [])
+
+        slower = {'scenarios': {'order_save': dict(
+            base['scenarios']['order_save'], p50_ms=30.0, throughput_per_s=30.0, queries=5,
+        )}}
+        regressions = compare(slower, base, tolerance=0.25)
+        self.assertEqual(len(regressions), 3)
+
+    def test_seed_and_run(self):
+        seed(products=20, users=5, orders=100, seed=1)
+        self.assertEqual(Order.objects.count(), 100)
+        report = run_all(iterations=2, batch=10, only=['order_save', 'action_mark_as_paid'])
+        self.assertEqual(set(report['scenarios']), {'order_save', 'action_mark_as_paid'})
+        self.assertEqual(report['scenarios']['order_save']['errors'], 0)
+        # Сценарии с изменением данных откатываются
+        self.assertEqual(Order.objects.count(), 100)
+
+    def test_seed_admin_and_flush_scope(self):
+        User.objects.create_user('bench_marketing', password='secret')
+        seed(products=5, users=2, orders=10, seed=1)
+        self.assertFalse(User.objects.get(username='bench_admin').has_usable_password())
+        # Повторный seed чистит только своих пользователей
+        seed(products=5, users=2, orders=10, seed=1)
+        self.assertTrue(User.objects.filter(username='bench_marketing').exists())
+        self.assertEqual(User.objects.filter(username__startswith='bench_user_').count(), 2)
+
+
+class PrerenderTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(PRERENDER_ROOT=self.tmp.name, PRERENDER_ENABLED=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(prerender._pages.clear)
+
+    def test_serves_prerendered_page_with_etag(self):
+        manifest = prerender.prerender_pages(['main.html'])
+        etag = manifest['main.html']['etag']
+
+        response = self.client.get(reverse('main'))
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertEqual(response.content, render_to_string('main.html').encode('utf-8'))
+
+        response = self.client.get(reverse('main'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse('main'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), render_to_string('main.html').encode('utf-8'))
+
+    def test_stale_prerender_falls_back_to_live_render(self):
+        prerender.prerender_pages(['contacts.html'])
+        manifest_path = Path(self.tmp.name) / prerender.MANIFEST_NAME
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        manifest['contacts.html']['fingerprint'] = 'outdated'
+        manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+
+        response = self.client.get(reverse('contacts'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+    @override_settings(DEBUG=False)
+    def test_prerender_after_miss_is_picked_up(self):
+        # Пререндер, который позже выложит другой процесс (manage.py prerender_pages)
+        other = tempfile.TemporaryDirectory()
+        self.addCleanup(other.cleanup)
+        prerender.prerender_pages(['main.html'], root=other.name)
+
+        response = self.client.get(reverse('main'))
+        self.assertFalse(response.has_header('ETag'))
+
+        for path in Path(other.name).iterdir():
+            (Path(self.tmp.name) / path.name).write_bytes(path.read_bytes())
+        response = self.client.get(reverse('main'))
+        self.assertTrue(response.has_header('ETag'))
+
+
+class CategoryFacetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+
+    def assertFacets(self, **expected):
+        counts = CategoryFacet.counts()
+        self.assertEqual({code: total for code, total in counts.items() if total}, expected)
+        self.assertEqual(counts, CategoryFacet.actual_counts())
+
+    def test_counts_follow_product_changes(self):
+        product = Product.objects.create(name='Тюльпаны', category='MONO', quantity=2)
+        Product.objects.create(name='Без категории', quantity=5)
+        Product.objects.create(name='Нет в наличии', category='GIFT', quantity=0)
+        self.assertFacets(MONO=1)
+
+        product = Product.objects.get(pk=product.pk)
+        product.decrease_quantity(2)
+        self.assertFacets()
+
+        product.increase_quantity(1)
+        self.assertFacets(MONO=1)
+
+        product.category = 'WEDDING'
+        product.save()
+        self.assertFacets(WEDDING=1)
+
+        product.is_active = False
+        product.save()
+        self.assertFacets()
+
+        product.is_active = True
+        product.save()
+        Product.objects.get(pk=product.pk).delete()
+        self.assertFacets()
+
+    def test_counts_follow_order_cancellation(self):
+        product = Product.objects.create(name='Розы', category='GIFT', quantity=1)
+        order = Order.objects.create(user=self.user, product=product, quantity=1)
+        product.decrease_quantity(1)
+        self.assertFacets()
+
+        order = Order.objects.get(pk=order.pk)
+        order.product.quantity += order.quantity
+        order.product.save()
+        self.assertFacets(GIFT=1)
+
+    def test_stale_instances_do_not_double_count(self):
+        Product.objects.create(name='Лилии', category='MIXED', quantity=1)
+        first, second = Product.objects.get(name='Лилии'), Product.objects.get(name='Лилии')
+        first.quantity = 0
+        first.save()
+        second.is_active = False
+        second.quantity = 0
+        second.save()
+        self.assertFacets()
+        self.assertEqual(CategoryFacet.objects.get(category='MIXED').in_stock, 0)
+
+        # Частичное сохранение устаревшего экземпляра: is_active в БД уже False
+        Product.objects.create(name='Тюльпаны', category='MONO', quantity=2)
+        stale = Product.objects.get(name='Тюльпаны')
+        fresh = Product.objects.get(name='Тюльпаны')
+        fresh.is_active = False
+        fresh.save()
+        stale.quantity = 1
+        stale.save(update_fields=['quantity'])
+        self.assertFacets()
+
+    def test_queryset_delete_updates_counts(self):
+        Product.objects.create(name='Тюльпаны', category='MONO', quantity=2)
+        Product.objects.create(name='Тюльпаны белые', category='MONO', quantity=1)
+        Product.objects.create(name='Розы', category='GIFT', quantity=1)
+        stale = Product.objects.get(name='Розы')
+        Product.objects.get(name='Розы').decrease_quantity(1)
+        Product.objects.filter(name__startswith='Тюльпаны').delete()
+        stale.delete()
+        self.assertFacets()
+        self.assertEqual(CategoryFacet.objects.get(category='GIFT').in_stock, 0)
+
+    def test_rebuild_fixes_drift(self):
+        Product.objects.create(name='Пионы', category='COMP', quantity=3)
+        Product.objects.update(quantity=0)  # QuerySet.update() обходит счётчики
+        with self.assertRaises(CommandError):
+            call_command('rebuild_category_facets', '--check', stdout=StringIO())
+
+        call_command('rebuild_category_facets', stdout=StringIO())
+        self.assertFacets()
+        call_command('rebuild_category_facets', '--check', stdout=StringIO())
+
+    def test_catalog_reads_counts(self):
+        Product.objects.create(name='Тюльпаны', category='MONO', quantity=2)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('catalog'))
+        self.assertContains(response, 'монобукеты (1)')
+
+
+class OrderAdminAutocompleteTests(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser('boss', 'boss@example.com', 'boss')
+        self.client.force_login(self.admin_user)
+        self.tulips = Product.objects.create(name='Тюльпаны', category='MONO', quantity=5)
+        self.roses = Product.objects.create(name='Розы красные', category='MONO', quantity=5)
+        Order.objects.create(user=self.admin_user, product=self.tulips, quantity=1)
+
+    def autocomplete(self, field_name, term):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'Main', 'model_name': 'order', 'field_name': field_name, 'term': term,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [row['text'] for row in response.json()['results']]
+
+    def test_add_form_does_not_list_all_products(self):
+        response = self.client.get(reverse('admin:Main_order_add'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, 'Розы красные')
+
+    def test_autocomplete_searches_by_prefix(self):
+        self.assertEqual(self.autocomplete('product', 'Роз'), [str(self.roses)])
+        self.assertEqual(self.autocomplete('product', 'красные'), [])
+        self.assertEqual(self.autocomplete('user', 'bo'), ['boss'])
+
+    def test_changelist_product_filter_is_lazy(self):
+        url = reverse('admin:Main_order_changelist')
+        response = self.client.get(url)
+        self.assertContains(response, 'filter_product__id__exact')
+        self.assertNotContains(response, 'Розы красные')
+
+        response = self.client.get(url, {'product__id__exact': self.tulips.pk, 'status__exact': 'NEW'})
+        self.assertContains(response, str(self.tulips))
+        self.assertContains(response, 'name="status__exact" value="NEW"')
+        self.assertNotContains(response, 'Розы красные')
+
+
+@skipUnless(importlib.util.find_spec('scipy'), 'numpy/scipy не установлены')
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(RECOMMENDATIONS_STATE_PATH=str(Path(self.tmp.name) / 'state.npz'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.products = [Product.objects.create(name=f'Букет {i}', quantity=100) for i in range(4)]
+        self.users = [User.objects.create_user(f'buyer{i}') for i in range(3)]
+
+    def buy(self, user, *products):
+        for product in products:
+            Order.objects.create(user=user, product=product)
+
+    def recommended(self, product):
+        return [item.pk for item in product.recommended_products()]
+
+    def test_incremental_build_matches_full(self):
+        from Main.recommendations import build
+
+        a, b, c, d = self.products
+        self.buy(self.users[0], a, b, b)
+        self.buy(self.users[1], a, b, c)
+        run = build()
+        self.assertEqual(run.orders_processed, 6)
+        self.assertEqual(self.recommended(a), [b.pk, c.pk])
+        self.assertEqual(self.recommended(d), [])
+
+        # Новые заказы существующего и нового покупателя
+        self.buy(self.users[0], c)
+        self.buy(self.users[2], a, c, d)
+        canceled = Order.objects.create(user=self.users[2], product=b, status='CANCELED')
+        run = build()
+        self.assertEqual(run.orders_processed, 4)
+        self.assertEqual(run.last_order_id, canceled.pk - 1)
+        incremental = {p.pk: self.recommended(p) for p in self.products}
+        self.assertEqual(incremental[a.pk], [c.pk, b.pk, d.pk])
+
+        build(full=True)
+        self.assertEqual({p.pk: self.recommended(p) for p in self.products}, incremental)
+
+    def test_cancellation_of_processed_order(self):
+        from Main.recommendations import build
+
+        a, b, c, d = self.products
+        self.buy(self.users[0], a, b, c)
+        self.buy(self.users[1], a, b)
+        build()
+        self.assertEqual(self.recommended(a), [b.pk, c.pk])
+
+        # Отмена уже учтённого заказа без новых заказов
+        order = Order.objects.get(user=self.users[0], product=c)
+        order.status = 'CANCELED'
+        order.save(update_fields=['status'])
+        run = build()
+        self.assertEqual(run.orders_processed, 0)
+        self.assertEqual(self.recommended(a), [b.pk])
+        self.assertEqual(self.recommended(c), [])
+
+        # Отмена и новый заказ того же покупателя в одном запуске
+        order = Order.objects.get(user=self.users[0], product=b)
+        order.status = 'CANCELED'
+        order.save(update_fields=['status'])
+        self.buy(self.users[0], d)
+        build()
+        incremental = {p.pk: self.recommended(p) for p in self.products}
+        self.assertEqual(incremental[a.pk], [b.pk, d.pk])
+        self.assertEqual(incremental[b.pk], [a.pk])
+
+        build(full=True)
+        self.assertEqual({p.pk: self.recommended(p) for p in self.products}, incremental)
+
+    def test_deleted_orders_need_full_rebuild(self):
+        from Main.recommendations import build
+
+        a, b = self.products[:2]
+        self.buy(self.users[0], a, b)
+        build()
+        Order.objects.filter(product=b).delete()
+        build()
+        # Удаление инкрементальный запуск не видит
+        self.assertEqual(self.recommended(a), [b.pk])
+        with override_settings(RECOMMENDATIONS_FULL_REBUILD_DAYS=0):
+            build()
+        self.assertEqual(self.recommended(a), [])
+
+    def test_endpoint_uses_single_query(self):
+        from Main.recommendations import build
+
+        a, b = self.products[:2]
+        self.buy(self.users[0], a, b)
+        build()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('recommendations', args=[a.pk]))
+        self.assertEqual([item['id'] for item in response.json()['items']], [b.pk])
+
+
+class MetricsTests(TestCase):
+    def test_render_text_format(self):
+        registry = metrics.Registry()
+        counter = metrics.Counter('demo_total', 'Демо', ['status'], registry=registry)
+        histogram = metrics.Histogram('demo_seconds', 'Время', ['view'], buckets=(0.1, 1), registry=registry)
+        counter.inc(status='NEW')
+        counter.inc(2, status='NEW')
+        histogram.observe(0.05, view='main')
+        histogram.observe(0.5, view='main')
+        histogram.observe(5, view='main')
+
+        text = registry.render()
+        self.assertIn('# TYPE demo_total counter\ndemo_total{status="NEW"} 3\n', text)
+        self.assertIn('demo_seconds_bucket{view="main",le="0.1"} 1\n', text)
+        self.assertIn('demo_seconds_bucket{view="main",le="1"} 2\n', text)
+        self.assertIn('demo_seconds_bucket{view="main",le="+Inf"} 3\n', text)
+        self.assertIn('demo_seconds_count{view="main"} 3\n', text)
+        with self.assertRaises(ValueError):
+            counter.inc(state='NEW')
+
+    def test_aggregates_worker_snapshots(self):
+        registry = metrics.Registry()
+        counter = metrics.Counter('demo_total', 'Демо', ['status'], registry=registry)
+        gauge = metrics.Gauge('demo_open', 'Открыто', registry=registry)
+        counter.inc(status='NEW')
+        gauge.set(2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Снимки двух завершившихся воркеров с одним pid: счётчики учитываются, gauge - нет
+            for tag in ('first', 'second'):
+                dead = registry.snapshot()
+                dead['pid'] = 2 ** 22 + 1
+                (Path(directory) / f"metrics-{dead['pid']}-{tag}.json").write_text(json.dumps(dead), encoding='utf-8')
+            text = registry.render(directory)
+            self.assertIn('demo_total{status="NEW"} 3\n', text)
+            self.assertIn('demo_open 2\n', text)
+
+            # Снимки завершившихся процессов слиты в архив и удалены
+            pid, tag = registry.process_id()
+            self.assertEqual(
+                sorted(path.name for path in Path(directory).glob('metrics-*.json')),
+                sorted([metrics.ARCHIVE_NAME, f'metrics-{pid}-{tag}.json']),
+            )
+            self.assertEqual(registry.render(directory), text)
+
+    def test_counters_wait_for_commit(self):
+        user = User.objects.create_user('buyer')
+        product = Product.objects.create(name='Тюльпаны', category='MONO', quantity=1)
+
+        def count(metric, *key):
+            return {tuple(labels): value for labels, value in metric.snapshot()}.get(key, 0)
+
+        before = count(metrics.ORDER_EVENTS, 'NEW')
+        reserved = count(metrics.STOCK_RESERVATIONS, 'model', 'ok')
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=user, product=product)
+        self.assertEqual(count(metrics.ORDER_EVENTS, 'NEW'), before + 1)
+
+        # Откат транзакции: заказа нет, и в метрике его тоже нет
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Order.objects.create(user=user, product=product)
+                    self.assertTrue(product.decrease_quantity(1))
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(count(metrics.ORDER_EVENTS, 'NEW'), before + 1)
+        self.assertEqual(count(metrics.STOCK_RESERVATIONS, 'model', 'ok'), reserved)
+
+    def test_endpoint_exposes_order_and_view_metrics(self):
+        user = User.objects.create_user('buyer')
+        product = Product.objects.create(name='Тюльпаны', category='MONO', quantity=1)
+        before = {tuple(key): value for key, value in metrics.ORDER_EVENTS.snapshot()}.get(('NEW',), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=user, product=product)
+        self.assertFalse(product.decrease_quantity(5))
+        self.client.get(reverse('catalog'))
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode('utf-8')
+        self.assertIn(f'mysite_orders_total{{status="NEW"}} {before + 1}\n', text)
+        self.assertIn('mysite_stock_reservations_total{source="model",result="insufficient"}', text)
+        self.assertIn('mysite_http_request_duration_seconds_count{view="catalog",method="GET"}', text)
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 403)
+        # Запрос через локальный прокси: REMOTE_ADDR разрешён, но это не сборщик
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(response.status_code, 403)
+
+    def test_mark_as_paid_is_not_a_reservation(self):
+        admin_user = User.objects.create_superuser('boss', 'boss@example.com', None)
+        self.client.force_login(admin_user)
+        product = Product.objects.create(name='Тюльпаны', category='MONO', quantity=0)
+        order = Order.objects.create(user=admin_user, product=product, quantity=2)
+        failed = {tuple(key): value for key, value in metrics.ADMIN_ACTIONS.snapshot()}.get(
+            ('mark_as_paid_action', 'failed'), 0)
+
+        self.client.post(reverse('admin:Main_order_changelist'), {
+            'action': 'mark_as_paid_action', '_selected_action': [order.pk],
+        })
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'NEW')
+        samples = {tuple(key): value for key, value in metrics.ADMIN_ACTIONS.snapshot()}
+        self.assertEqual(samples[('mark_as_paid_action', 'failed')], failed + 1)
+        # Оплата не резервирует товар: в счётчике резервирований её нет
+        self.assertNotIn('admin_paid', {key[0] for key, _ in metrics.STOCK_RESERVATIONS.snapshot()})
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_endpoint_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(response.status_code, 200)
@@ -1,16 +1,63 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.conf import settings
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from .metrics import REGISTRY
+from .models import CategoryFacet, Product
+from .prerender import prerendered
 
 # Create your views here
+@prerendered('main.html')
 def main(request):
     return render(request, 'main.html')
 
+@prerendered('contacts.html')
 def contacts(request):
     return render(request, 'contacts.html')
 
 def catalog(request):
-    return render(request, 'catalog.html')
+    # Счётчики читаются из CategoryFacet: одна выборка по числу категорий вместо GROUP BY по товарам
+    category_counts = CategoryFacet.counts()
+    return render(request, 'catalog.html', {
+        'category_counts': category_counts,
+        'total_in_stock': sum(category_counts.values()),
+    })
 
+@prerendered('payment.html')
 def payment(request):
     return render(request, 'payment.html')
 
+def recommendations(request, product_id):
+    # Для кросс-продаж на статичных страницах: данные подгружаются отдельным запросом
+    try:
+        limit = min(int(request.GET.get('limit', 6)), settings.RECOMMENDATIONS_TOP_K)
+    except ValueError:
+        limit = 6
+    items = Product.recommended_for(product_id, limit=max(limit, 1))
+    return JsonResponse({
+        'product': product_id,
+        'items': [
+            {'id': item.id, 'name': item.name, 'price': str(item.price)}
+            for item in items
+        ],
+    })
+
+# Заголовки, которые добавляет обратный прокси: за ним REMOTE_ADDR - адрес самого прокси
+PROXY_HEADERS = ('HTTP_X_FORWARDED_FOR', 'HTTP_X_REAL_IP', 'HTTP_FORWARDED')
+
+
+def metrics_allowed(request):
+    """Доступ к /metrics: по токену, а без него - только прямое подключение с METRICS_ALLOWED_IPS"""
+    if settings.METRICS_TOKEN:
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        return constant_time_compare(authorization, f'Bearer {settings.METRICS_TOKEN}')
+    if any(header in request.META for header in PROXY_HEADERS):
+        return False
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
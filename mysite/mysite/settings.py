@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -19,13 +20,29 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
+# Все значения, зависящие от окружения, читаются из переменных DJANGO_*,
+# значения по умолчанию совпадают с локальной разработкой.
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_list(name, default=''):
+    return [item.strip() for item in os.environ.get(name, default).split(',') if item.strip()]
+
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-7thtc_g=2r=%mm)9#s)prf#^y)j1lvaha60#&3(eygxryn=$t%'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-7thtc_g=2r=%mm)9#s)prf#^y)j1lvaha60#&3(eygxryn=$t%',
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', True)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS')
 
 
 # Application definition
@@ -41,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Main.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,20 +92,37 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-import pymysql
-pymysql.version_info = (2, 2, 1, "final", 0)
-pymysql.install_as_MySQLdb()
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'django_db',
-        'USER': 'django_user',
-        'PASSWORD': 'django123',
-        'HOST': '127.0.0.1',  # <-- Используй IP вместо localhost, чтобы не зависеть от сокета
-        'PORT': '3306',
+# pymysql импортируется только для MySQL: backend Django загружается ещё в
+# django.setup(), поэтому отложить импорт дальше настроек нельзя, но запуски
+# на SQLite (тесты, бенчмарки, cron без MySQL) его не платят.
+DB_ENGINE = os.environ.get('DJANGO_DB_ENGINE', 'mysql')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+            # IMMEDIATE сразу берёт блокировку на запись: параллельные резервирования
+            # ждут своей очереди вместо ошибки "database is locked"
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        }
+    }
+else:
+    import pymysql
+    pymysql.version_info = (2, 2, 1, "final", 0)
+    pymysql.install_as_MySQLdb()
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': os.environ.get('DJANGO_DB_NAME', 'django_db'),
+            'USER': os.environ.get('DJANGO_DB_USER', 'django_user'),
+            'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', 'django123'),
+            'HOST': os.environ.get('DJANGO_DB_HOST', '127.0.0.1'),  # <-- Используй IP вместо localhost, чтобы не зависеть от сокета
+            'PORT': os.environ.get('DJANGO_DB_PORT', '3306'),
+            'CONN_MAX_AGE': int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', '0')),
+        }
     }
-}
 
 
 # Password validation
@@ -107,15 +142,13 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
-import os
-MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
 LANGUAGE_CODE = 'en-us'
 
-TIME_ZONE = 'UTC'
+TIME_ZONE = 'Europe/Moscow'
 
 USE_I18N = True
 
@@ -125,21 +158,54 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-STATIC_URL = 'static/'
+STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_DIRS = [
+    os.path.join(BASE_DIR, 'Main/static'),
+]
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-TIME_ZONE = 'Europe/Moscow'
-USE_TZ = True
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-STATIC_URL = '/static/'
-STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, 'static'),
+# Пререндер статичных страниц (manage.py prerender_pages, Main.prerender)
+PRERENDER_ENABLED = env_bool('DJANGO_PRERENDER', True)
+PRERENDER_ROOT = os.path.join(BASE_DIR, 'prerendered')
+PRERENDER_TEMPLATES = [
+    'main.html',
+    'contacts.html',
+    'payment.html',
+]
+PRERENDER_MAX_AGE = int(os.environ.get('DJANGO_PRERENDER_MAX_AGE', 60 * 60 * 24))
+
+# Рекомендации "часто покупают вместе" (manage.py build_recommendations)
+RECOMMENDATIONS_TOP_K = 10
+RECOMMENDATIONS_STATE_PATH = os.path.join(BASE_DIR, 'recommendations', 'copurchase.npz')
+# Удалённые заказы инкрементальный запуск не видит, полный пересчёт раз в N дней
+RECOMMENDATIONS_FULL_REBUILD_DAYS = 7
+
+# Метрики Prometheus (Main.metrics, /metrics). Для нескольких воркеров задайте
+# DJANGO_METRICS_DIR - общий каталог снимков, очищаемый при деплое.
+METRICS_DIR = os.environ.get('DJANGO_METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('DJANGO_METRICS_FLUSH_INTERVAL', 5))
+# Доступ к /metrics. Если задан DJANGO_METRICS_TOKEN, сборщик передаёт
+# "Authorization: Bearer <токен>" - так и нужно делать за nginx/другим прокси.
+# Без токена пускаются только прямые подключения с METRICS_ALLOWED_IPS, а
+# запросы с X-Forwarded-For/X-Real-IP/Forwarded отклоняются: за локальным
+# прокси REMOTE_ADDR всегда 127.0.0.1. Прокси должен выставлять один из этих
+# заголовков, иначе /metrics нельзя публиковать через него без токена.
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN') or None
+METRICS_ALLOWED_IPS = env_list('DJANGO_METRICS_ALLOWED_IPS', '127.0.0.1,::1')
+
+# Прогрев резолвера URL и кеша шаблонов при старте WSGI-воркера (mysite.startup)
+WARMUP_ON_STARTUP = env_bool('DJANGO_WARMUP_ON_STARTUP', True)
+WARMUP_TEMPLATES = [
+    'main.html',
+    'contacts.html',
+    'catalog.html',
+    'payment.html',
 ]
-STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, 'Main/static'),
-]
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Прогрев процесса при старте воркера.
+
+Первый запрос к свежему воркеру оплачивает сборку резолвера URL,
+импорт urls.py/admin и компиляцию шаблонов. warm_up() делает это заранее,
+сразу после get_wsgi_application(), чтобы первый пользователь не ждал.
+"""
+
+import time
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+
+
+def warm_up_urls():
+    """Построить резолвер URL (импортирует urls.py, admin и все views)"""
+    resolver = get_resolver()
+    # reverse() заполняет reverse_dict и namespace_dict резолвера
+    for name in ('main', 'contacts', 'catalog', 'payment', 'admin:index'):
+        reverse(name)
+    return resolver
+
+
+def warm_up_templates(names=None):
+    """Скомпилировать шаблоны в кеш cached.Loader"""
+    if names is None:
+        names = getattr(settings, 'WARMUP_TEMPLATES', [])
+    loaded = []
+    for name in names:
+        try:
+            get_template(name)
+        except TemplateDoesNotExist:
+            continue
+        loaded.append(name)
+    return loaded
+
+
+def warm_up():
+    """Прогреть резолвер и шаблоны, вернуть затраченное время по шагам (в секундах)"""
+    timings = {}
+    start = time.perf_counter()
+    warm_up_urls()
+    timings['urls'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm_up_templates()
+    timings['templates'] = time.perf_counter() - start
+    return timings
@@ -26,6 +26,8 @@ urlpatterns = [
     path('contacts/',views.contacts,name='contacts'),
     path('catalog/',views.catalog,name='catalog'),
     path('payment/',views.payment,name='payment'),
+    path('recommendations/<int:product_id>/',views.recommendations,name='recommendations'),
+    path('metrics',views.metrics,name='metrics'),
 ]
 from django.contrib import admin
 from django.urls import path